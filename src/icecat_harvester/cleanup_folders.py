@@ -32,7 +32,8 @@ def main():
         print(f"No data directory found at {XML_SOURCE_DIR}")
         return
 
-    existing_folders = [f for f in os.listdir(XML_SOURCE_DIR) if os.path.isdir(os.path.join(XML_SOURCE_DIR, f))]
+    with os.scandir(XML_SOURCE_DIR) as it:
+        existing_folders = [e.name for e in it if e.is_dir()]
     
     to_delete = []
     for folder in existing_folders:
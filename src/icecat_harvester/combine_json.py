@@ -46,7 +46,8 @@ def main():
     print(f"Output will be written to: {output_dir}")
 
     # --- Processing ---
-    categories = [d for d in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, d))]
+    with os.scandir(input_dir) as it:
+        categories = [e.name for e in it if e.is_dir()]
     if not categories:
         print(f"No category subdirectories found in {input_dir}.")
         return
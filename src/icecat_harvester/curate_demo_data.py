@@ -68,8 +68,9 @@ def main():
         return
 
     # Map target names (normalized) to actual folder names on disk
-    existing_folders = {d.lower().replace('_', ' ').replace('-', ' '): d
-                        for d in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, d))}
+    with os.scandir(input_dir) as it:
+        existing_folders = {e.name.lower().replace('_', ' ').replace('-', ' '): e.name
+                            for e in it if e.is_dir()}
 
     print(f"✅ Targets loaded. Searching for balanced keywords: {', '.join(keywords)}")
     final_items = []
@@ -141,9 +142,9 @@ def main():
 
     if final_items:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # Build the whole catalog in memory and write it in one call
         with open(output_path, 'w', encoding='utf-8') as f_out:
-            for item in final_items:
-                f_out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            f_out.write("".join(json.dumps(item, ensure_ascii=False) + "\n" for item in final_items))
         print(f"\n🚀 Balanced demo catalog generated with {len(final_items)} items.")
         print(f"📍 Location: {output_path}")
     else:
@@ -1,6 +1,8 @@
 import os
+import io
 import csv
 import gzip
+from collections import Counter
 from tqdm import tqdm
 
 # --- PATH CONFIGURATION ---
@@ -18,6 +20,9 @@ OUTPUT_COUNTS_MD = os.path.join(DATA_DIR, "category_counts.md")
 FILES_INDEX_XML = os.path.join(DATA_DIR, "files.index.xml")
 FILES_INDEX_GZ = os.path.join(DATA_DIR, "files.index.xml.gz")
 
+# Read-ahead for the index scan: fewer, larger trips into zlib and the OS
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+
 def load_targets():
     if not os.path.exists(TARGETS_FILE): return []
     targets = []
@@ -65,23 +70,30 @@ def main():
 
     print(f"Scanning index ({os.path.basename(index_file)}) for global stats...")
     
-    global_counts = {}
+    global_counts = Counter()
     opener = gzip.open if index_file.endswith('.gz') else open
     
     try:
-        with opener(index_file, 'rb') as f:
+        with io.BufferedReader(opener(index_file, 'rb'), buffer_size=READ_BUFFER_SIZE) as f:
             f_size = os.path.getsize(index_file)
             with tqdm(total=f_size, unit='B', unit_scale=True, desc="Scanning Index") as pbar:
+                accumulated_bytes = 0
                 for line in f:
-                    pbar.update(len(line))
+                    accumulated_bytes += len(line)
+                    if accumulated_bytes > 5 * 1024 * 1024:
+                        pbar.update(accumulated_bytes)
+                        accumulated_bytes = 0
+
                     if b'<file ' not in line: continue
                     
-                    line_str = line.decode('utf-8', errors='ignore')
-                    start = line_str.find('Catid="')
+                    # Only the Catid value is decoded, not the whole line
+                    start = line.find(b'Catid="')
                     if start != -1:
-                        end = line_str.find('"', start + 7)
-                        cid = line_str[start+7:end]
-                        global_counts[cid] = global_counts.get(cid, 0) + 1
+                        end = line.find(b'"', start + 7)
+                        cid = line[start+7:end].decode('utf-8', errors='ignore')
+                        global_counts[cid] += 1
+
+                pbar.update(accumulated_bytes)
                             
     except Exception as e:
         print(f"Error reading index: {e}")
@@ -92,30 +104,38 @@ def main():
         for cid, name in cat_map.items():
             safe_name = name.replace(" ", "_").replace("/", "-").replace("&", "and")
             folder_path = os.path.join(XML_SOURCE_DIR, safe_name)
-            if os.path.exists(folder_path):
-                local_counts[cid] = len([n for n in os.listdir(folder_path) if n.endswith('.xml')])
+            try:
+                with os.scandir(folder_path) as it:
+                    local_counts[cid] = sum(1 for e in it if e.name.endswith('.xml'))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
 
     # 3. Output to Markdown
     print(f"\nSaving full breakdown to {OUTPUT_COUNTS_MD}...")
-    sorted_stats = sorted(global_counts.items(), key=lambda x: x[1], reverse=True)
+    sorted_stats = global_counts.most_common()
     
-    with open(OUTPUT_COUNTS_MD, 'w', encoding='utf-8') as f:
-        # Markdown Header
-        f.write("# Icecat Category Statistics\n\n")
-        f.write(f"**Total Categories:** {len(sorted_stats)}\n\n")
-        f.write("| Category ID | Name | Total Available (Index) | Downloaded (Local) |\n")
-        f.write("|---|---|---|---|\n")
+    # Markdown Header
+    lines = [
+        "# Icecat Category Statistics\n\n",
+        f"**Total Categories:** {len(sorted_stats)}\n\n",
+        "| Category ID | Name | Total Available (Index) | Downloaded (Local) |\n",
+        "|---|---|---|---|\n",
+    ]
+    
+    # Markdown Rows
+    for cid, count in sorted_stats:
+        name = cat_map.get(cid, f"Unknown ID {cid}")
+        local = local_counts.get(cid, 0)
         
-        # Markdown Rows
-        for cid, count in sorted_stats:
-            name = cat_map.get(cid, f"Unknown ID {cid}")
-            local = local_counts.get(cid, 0)
-            
-            # Simple bolding for targets to make them pop in the file
-            if cid in target_ids:
-                name = f"**{name}**"
-            
-            f.write(f"| {cid} | {name} | {count} | {local} |\n")
+        # Simple bolding for targets to make them pop in the file
+        if cid in target_ids:
+            name = f"**{name}**"
+        
+        lines.append(f"| {cid} | {name} | {count} | {local} |\n")
+
+    # Build the report in memory and hand it to the file in one call
+    with open(OUTPUT_COUNTS_MD, 'w', encoding='utf-8') as f:
+        f.write("".join(lines))
 
     # 4. Print UI Report
     
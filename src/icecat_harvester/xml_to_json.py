@@ -2,12 +2,19 @@ import os
 import json
 import csv
 import shutil
-import hashlib
-import xml.etree.ElementTree as ET
+import sys
+import zlib
+import orjson
+from lxml import etree as ET
 import argparse
 import random
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
 from datetime import datetime
+from functools import lru_cache
 from tqdm import tqdm
 
 # --- CONFIGURATION ---
@@ -22,14 +29,41 @@ FEATURES_CSV = os.path.join(DATA_DIR, "features.csv")
 PRICES_NDJSON = os.path.join(DATA_DIR, "price_baselines.ndjson")
 
 BATCH_SIZE = 1000 
+PARSE_CHUNKSIZE = 64  # Files handed to a worker per round-trip
+
+# Presentation values that carry no information on their own
+BOOLEAN_VALUES = frozenset(("Y", "N", "Yes", "No"))
+DEFAULT_GROUP = {"name": "General", "order": 9999}
+
+# Brand tiers for the price estimate (lowercase)
+PREMIUM_BRANDS = frozenset(("apple", "samsung", "sony", "hp", "dell", "lenovo", "bose", "cisco"))
+BUDGET_BRANDS = frozenset(("trust", "hama", "generic", "startech", "sweex"))
+# Fallback base price for categories missing from the price map; first substring match wins
+HEURISTIC_PRICES = (("server", 1500), ("laptop", 800), ("software", 100), ("cable", 15))
+
+# ProductPicture URL attributes, best first
+IMAGE_PRIORITIES = ("Pic500x500", "Pic", "Original", "HighPic")
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# Compiled once per process; returning @Value directly skips building element proxies
+FEATURE_NAME_XP = ET.XPath("Feature/Name/@Value", smart_strings=False)
+GROUP_NAME_XP = ET.XPath("FeatureGroup/Name/@Value", smart_strings=False)
+
+# One parser per process; Icecat product files never need blank text, IDs or entities
+XML_PARSER = ET.XMLParser(remove_blank_text=True, collect_ids=False, resolve_entities=False)
 
 # --- LOADERS ---
 def load_feature_map():
     f_map = {}
     if os.path.exists(FEATURES_CSV):
         with open(FEATURES_CSV, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader: f_map[row['ID']] = row['Name']
+            # Plain rows; DictReader would build a dict per feature just to read two columns
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header:
+                id_col, name_col = header.index('ID'), header.index('Name')
+                f_map = {row[id_col]: sys.intern(row[name_col]) for row in reader if row}
     return f_map
 
 def load_price_map():
@@ -47,93 +81,127 @@ def load_price_map():
 # --- HELPERS ---
 def clean_html_text(text):
     if not text: return ""
-    text = re.sub(r'<[^>]+>', ' ', text)
+    # Most descriptions carry no markup; skip the regex engine for those
+    if "<" in text: text = HTML_TAG_RE.sub(' ', text)
     return " ".join(text.split())
 
-def get_heuristic_fallback(cat_name):
-    if not cat_name: return 50.0
-    name = cat_name.lower()
-    if "server" in name: return 1500
-    if "laptop" in name: return 800
-    if "software" in name: return 100
-    if "cable" in name: return 15
+# Each distinct category is priced once, however many products share it
+@lru_cache(maxsize=None)
+def get_heuristic_fallback(cat_key):
+    # cat_key arrives lowercased from estimate_price
+    if not cat_key: return 50.0
+    for needle, price in HEURISTIC_PRICES:
+        if needle in cat_key: return price
     return 45.0 
 
+# Unbounded: thousands of suppliers would keep a small LRU evicting and missing
+@lru_cache(maxsize=None)
+def get_brand_multiplier(brand_name):
+    b = brand_name.lower()
+    if b in PREMIUM_BRANDS: return 1.3
+    if b in BUDGET_BRANDS: return 0.8
+    return 1.0
+
 def estimate_price(prod_id, cat_name, brand_name, price_map):
     if not prod_id: return 0.0
     base = 50.0
     if cat_name:
         key = cat_name.lower()
-        base = price_map.get(key, get_heuristic_fallback(key))
+        # Only consult the fallback on a miss; a .get() default is evaluated every call
+        base = price_map.get(key)
+        if base is None: base = get_heuristic_fallback(key)
     
     # Brand Premium/Discount Logic
-    multiplier = 1.0
-    if brand_name:
-        b = brand_name.lower()
-        if b in ["apple", "samsung", "sony", "hp", "dell", "lenovo", "bose", "cisco"]:
-            multiplier = 1.3 
-        elif b in ["trust", "hama", "generic", "startech", "sweex"]:
-            multiplier = 0.8 
+    if brand_name: base *= get_brand_multiplier(brand_name)
     
-    base *= multiplier
-    hash_val = int(hashlib.md5(prod_id.encode()).hexdigest(), 16)
+    # Any stable, evenly spread hash will do here; CRC32 is far cheaper than md5
+    hash_val = zlib.crc32(prod_id.encode())
     variance = base * 0.6 
     price = base + (variance * (((hash_val % 1000) / 1000.0) - 0.5))
     return round(max(price, 1.0), 2)
 
 # --- PARSER ---
-def parse_icecat_xml(xml_path, feature_map, price_map):
+def parse_icecat_xml(xml_path, feature_map, price_map, include_key_specs=True):
+    """Returns the product as an output dict, or None if unreadable or missing a title or image."""
     try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        product = root.find(".//Product")
-        if product is None: 
-            if root.tag.endswith("Product"): product = root
-            else: return None
-
-        # Map Groups for Description synthesis
-        group_map = {} 
-        for cfg in product.findall(".//CategoryFeatureGroup"):
-            cfg_id = cfg.get("ID")
-            order_no = int(cfg.get("No") or 999)
-            fg_node = cfg.find(".//FeatureGroup")
-            if fg_node is not None:
-                name_node = fg_node.find(".//Name")
-                if name_node is not None:
-                    g_name = name_node.get("Value")
-                    if cfg_id and g_name:
-                        group_map[cfg_id] = {"name": g_name, "order": order_no}
-
-        grouped_specs = {}
-        attrs = {}  
-        
-        for feature in product.findall(".//ProductFeature"):
+        root = ET.parse(xml_path, XML_PARSER).getroot()
+        # The record is the root or its direct child; deeper Products are ProductRelated/ProductBundled entries
+        product = root if root.tag == "Product" else root.find("Product")
+        if product is None: return None
+
+        # QUALITY GUARD: untitled products are dropped, so stop before reading the rest
+        title = product.get("Title")
+        if not title: return None
+
+        # High-Quality Image Filtering: keep the best-ranked URL across the record's own
+        # pictures (nested products carry theirs), only probing attributes that would
+        # beat the current pick
+        image_url, image_rank = None, len(IMAGE_PRIORITIES)
+        for pic in product.iter("ProductPicture"):
+            if next(pic.iterancestors("Product")) is not product: continue
+            for rank in range(image_rank):
+                url = pic.get(IMAGE_PRIORITIES[rank])
+                if url and "http" in url:
+                    image_url, image_rank = url, rank
+                    break
+            if image_rank == 0: break
+
+        # QUALITY GUARD: no usable image means no record; skip the feature and description work
+        if image_url is None: return None
+
+        # Map Groups for Description synthesis (only needed for the Key Specifications block)
+        group_map = {}
+        if include_key_specs:
+            for cfg in product.iterchildren("CategoryFeatureGroup"):
+                cfg_id = cfg.get("ID")
+                order_no = int(cfg.get("No") or 999)
+                names = GROUP_NAME_XP(cfg)
+                if cfg_id and names and names[0]:
+                    group_map[cfg_id] = {"name": names[0], "order": order_no}
+
+        features = []  # (name, value, group id) in document order
+        attrs = {}
+        for feature in product.iterchildren("ProductFeature"):
             raw_value = feature.get("Presentation_Value")
-            if not raw_value or raw_value in ["Y", "N", "Yes", "No"]: continue
+            if not raw_value or raw_value in BOOLEAN_VALUES: continue
+
+            names = FEATURE_NAME_XP(feature)
+            if names:
+                feat_name = names[0]
+            else:
+                # Only build the placeholder name when the lookup actually misses
+                local_id = feature.get("Local_ID")
+                feat_name = feature_map.get(local_id)
+                if feat_name is None: feat_name = f"Feature_{local_id}"
 
-            feat_node = feature.find(".//Feature/Name")
-            feat_name = feat_node.get("Value") if feat_node is not None else feature_map.get(feature.get("Local_ID"), f"Feature_{feature.get('Local_ID')}")
-            
             safe_name = feat_name.replace("|", "/").replace(".", "")
             attrs[safe_name] = raw_value.replace("|", "/")
+            if include_key_specs:
+                features.append((feat_name, raw_value, feature.get("CategoryFeatureGroup_ID")))
+
+        # Singletons must be direct children; ProductRelated carries its own Supplier/Category
+        supplier = product.find("Supplier")
+        brand = supplier.get("Name") if supplier is not None else ""
+
+        desc_node = product.find("ProductDescription")
+        long_desc = desc_node.get("LongDesc") if desc_node is not None else None
+
+        cat_node = product.find("Category/Name")
+        cat_val = cat_node.get("Value") if cat_node is not None else None
 
-            group_id = feature.get("CategoryFeatureGroup_ID")
-            group_info = group_map.get(group_id, {"name": "General", "order": 9999})
+        grouped_specs = {}
+        for feat_name, raw_value, group_id in features:
+            group_info = group_map.get(group_id, DEFAULT_GROUP)
             g_name = group_info['name']
-            if g_name not in grouped_specs:
-                grouped_specs[g_name] = {"order": group_info['order'], "items": []}
-            grouped_specs[g_name]["items"].append(f"{feat_name}: {raw_value}")
+            # One lookup per feature; setdefault would build a throwaway dict every time
+            entry = grouped_specs.get(g_name)
+            if entry is None: entry = grouped_specs[g_name] = {"order": group_info['order'], "items": []}
+            entry["items"].append(f"{feat_name}: {raw_value}")
 
-        title = product.get("Title") or ""
-        brand = (product.find(".//Supplier").get("Name") if product.find(".//Supplier") is not None else "")
-        
         # Synthesize Markdown Description
         desc_parts = [title]
-        desc_node = product.find(".//ProductDescription")
-        if desc_node is not None:
-            long_desc = desc_node.get("LongDesc")
-            if long_desc and len(long_desc) > 20:
-                desc_parts.append("\n\n" + clean_html_text(long_desc))
+        if long_desc and len(long_desc) > 20:
+            desc_parts.append("\n\n" + clean_html_text(long_desc))
 
         if grouped_specs:
             desc_parts.append("\n\nKey Specifications:")
@@ -146,37 +214,60 @@ def parse_icecat_xml(xml_path, feature_map, price_map):
             "title": title,
             "brand": brand,
             "description": "\n".join(desc_parts),
-            "image_url": None,
+            "image_url": image_url,
             "price": 0.0, 
             "currency": "USD",
             "categories": [],
             "attrs": attrs,                
-            "attr_keys": sorted(list(attrs.keys()))
+            "attr_keys": sorted(attrs)
         }
         
-        cat_node = product.find(".//Category/Name")
-        cat_val = cat_node.get("Value") if cat_node is not None else None
         if cat_val: item["categories"].append(cat_val)
         item["price"] = estimate_price(item["id"], cat_val, brand, price_map)
 
-        # High-Quality Image Filtering
-        priorities = ["Pic500x500", "Pic", "Original", "HighPic"]
-        for pic in product.findall(".//ProductPicture"):
-            for attr in priorities:
-                url = pic.get(attr)
-                if url and "http" in url:
-                    item["image_url"] = url
-                    break
-            if item["image_url"]: break
-
         return item
     except Exception: return None
 
+# --- WORKERS ---
+# Read-only lookups, installed once per worker process by _init_worker so
+# they are not pickled again for every file.
+_feature_map = {}
+_price_map = {}
+_include_key_specs = True
+
+def _init_worker(feature_map, price_map, include_key_specs):
+    global _feature_map, _price_map, _include_key_specs
+    _feature_map = feature_map
+    _price_map = price_map
+    _include_key_specs = include_key_specs
+
+def _parse_one(xml_path):
+    item = parse_icecat_xml(xml_path, _feature_map, _price_map, _include_key_specs)
+    if item is None: return None
+    # Serialize here so the parent only pickles one bytes object per record
+    return orjson.dumps(item)
+
+def _parse_chunk(xml_paths):
+    return [_parse_one(p) for p in xml_paths]
+
+def parse_in_order(pool, xml_paths, chunksize, max_pending):
+    """Yields serialized records (None for skipped files) in input order, keeping at most max_pending chunks in flight."""
+    pending = deque()
+    for start in range(0, len(xml_paths), chunksize):
+        pending.append(pool.submit(_parse_chunk, xml_paths[start:start + chunksize]))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+def write_ndjson(filepath, lines, mode="wb"):
+    # Lines arrive already serialized by the workers; one write per file
+    with open(filepath, mode) as f:
+        f.write(b"\n".join(lines) + b"\n")
+
 def flush_batch(cat_json_dir, batch_data, batch_idx):
     if not batch_data: return
-    filepath = os.path.join(cat_json_dir, f"batch_{batch_idx:03d}.ndjson")
-    with open(filepath, "w", encoding="utf-8") as f:
-        for item in batch_data: f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    write_ndjson(os.path.join(cat_json_dir, f"batch_{batch_idx:03d}.ndjson"), batch_data)
 
 # --- MAIN ---
 def main():
@@ -187,6 +278,8 @@ def main():
     parser.add_argument("--max-output-records", type=int, default=0)
     parser.add_argument("--output-subdir", type=str, default="")
     parser.add_argument("--yes", action="store_true")
+    parser.add_argument("--no-key-specs", action="store_true", help="Omit the Key Specifications block from descriptions.")
+    parser.add_argument("--workers", type=int, default=0, help="Parser processes (default: one per CPU).")
     args = parser.parse_args()
 
     random.seed(args.seed)
@@ -201,60 +294,66 @@ def main():
         shutil.rmtree(out_root)
     os.makedirs(out_root, exist_ok=True)
 
-    categories = sorted([d for d in os.listdir(XML_SOURCE_DIR) if os.path.isdir(os.path.join(XML_SOURCE_DIR, d))])
+    with os.scandir(XML_SOURCE_DIR) as it:
+        categories = sorted(e.name for e in it if e.is_dir())
     
     # PHASE 1: Document Count for Accurate Progress Bar
     print("🔍 Pre-calculating total job size...")
     total_docs = 0
     cat_files = {}
     for cat in categories:
-        names = [f for f in os.listdir(os.path.join(XML_SOURCE_DIR, cat)) if f.endswith(".xml")]
+        with os.scandir(os.path.join(XML_SOURCE_DIR, cat)) as it:
+            # DirEntry.path is already joined, so no per-file os.path.join later
+            paths = [e.path for e in it if e.name.endswith(".xml") and e.is_file(follow_symlinks=False)]
         limit = args.generate_sample_data if is_sampling else args.max_input_files
-        count = min(len(names), limit) if limit > 0 else len(names)
-        cat_files[cat] = names
+        count = min(len(paths), limit) if limit > 0 else len(paths)
+        cat_files[cat] = paths
         total_docs += count
         if args.max_output_records and total_docs >= args.max_output_records:
             total_docs = args.max_output_records
             break
 
-    # PHASE 2: Process with Throttled Feedback
+    # PHASE 2: Select the files to parse, in category order
+    job_cats, job_paths = [], []
+    for cat in categories:
+        if args.max_output_records and len(job_paths) >= args.max_output_records: break
+        
+        paths = cat_files.get(cat, [])
+        if not paths: continue
+        
+        # Always shuffle for Samples; shuffle for Production only if a limit is applied
+        if is_sampling or args.max_input_files > 0:
+            random.shuffle(paths)
+            limit = args.generate_sample_data if is_sampling else args.max_input_files
+            paths = paths[:limit]
+        if args.max_output_records:
+            paths = paths[:args.max_output_records - len(job_paths)]
+
+        job_cats.extend([cat] * len(paths))
+        job_paths.extend(paths)
+
+    # PHASE 3: Process with Throttled Feedback
     stats = {"converted": 0, "skipped": 0}
-    total_processed = 0
-
-    
 
-    with tqdm(total=total_docs, unit="doc", desc="Total Progress") as pbar:
-        for cat in categories:
-            if args.max_output_records and total_processed >= args.max_output_records: break
-            
-            names = cat_files.get(cat, [])
-            if not names: continue
-            
-            # Always shuffle for Samples; shuffle for Production only if a limit is applied
-            if is_sampling or args.max_input_files > 0:
-                random.shuffle(names)
-                limit = args.generate_sample_data if is_sampling else args.max_input_files
-                names = names[:limit]
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    # Small runs still get spread over every worker
+    chunksize = max(1, min(PARSE_CHUNKSIZE, len(job_paths) // (workers * 4)))
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(feature_map, price_map, not args.no_key_specs))
 
+    with pool, tqdm(total=total_docs, unit="doc", desc="Total Progress", mininterval=0.5) as pbar:
+        # One stream across all categories, so workers never idle at a category boundary
+        results = zip(job_cats, parse_in_order(pool, job_paths, chunksize, workers * 2))
+        for cat, cat_results in groupby(results, key=itemgetter(0)):
             cat_out = os.path.join(out_root, cat) if not is_sampling else out_root
             os.makedirs(cat_out, exist_ok=True)
             batch_data, batch_idx = [], 1
+            # Postfix changes once per category; the next redraw picks it up
+            pbar.set_postfix_str(f"cat={cat[:10]}, skip={stats['skipped']}", refresh=False)
 
-            for xml_file in names:
-                if args.max_output_records and total_processed >= args.max_output_records: break
-                
-                item = parse_icecat_xml(os.path.join(XML_SOURCE_DIR, cat, xml_file), feature_map, price_map)
-                
-                # QUALITY GUARD: Only proceed if item has a valid title and image
-                if item and item.get("image_url") and item.get("title"):
-                    if is_sampling:
-                        # Write directly to the category's sample file
-                        with open(os.path.join(out_root, f"{cat}.ndjson"), "a") as sf:
-                            sf.write(json.dumps(item, ensure_ascii=False) + "\n")
-                    else:
-                        batch_data.append(item)
-                    
-                    total_processed += 1
+            for _, line in cat_results:
+                if line is not None:
+                    batch_data.append(line)
                     stats["converted"] += 1
                     
                     if not is_sampling and len(batch_data) >= BATCH_SIZE:
@@ -262,18 +361,17 @@ def main():
                         batch_data, batch_idx = [], batch_idx + 1
                 else:
                     stats["skipped"] += 1
-                    # We still increment processed count for the bar so it doesn't lag
-                    total_processed += 1
                 
-                # THROTTLED REFRESH: Update every 100 docs to keep CPU focused on parsing
-                if total_processed % 100 == 0:
-                    pbar.n = total_processed
-                    pbar.set_postfix(cat=cat[:10], skip=stats["skipped"])
-                    pbar.refresh()
-
-            if batch_data and not is_sampling: flush_batch(cat_out, batch_data, batch_idx)
-            pbar.n = total_processed
-            pbar.refresh()
+                # Skipped docs count too so the bar doesn't lag; tqdm throttles the redraws
+                pbar.update(1)
+
+            if batch_data:
+                if is_sampling:
+                    # Samples are small; append the whole category to its file in one go
+                    write_ndjson(os.path.join(out_root, f"{cat}.ndjson"), batch_data, "ab")
+                else:
+                    flush_batch(cat_out, batch_data, batch_idx)
+            pbar.set_postfix_str(f"cat={cat[:10]}, skip={stats['skipped']}", refresh=False)
 
     print(f"\n✅ Done! Total Converted: {stats['converted']} | Skipped (Low Quality): {stats['skipped']}")
 